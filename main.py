@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
 
 from dataclasses import dataclass
+from enum import IntEnum
 import csv
 import argparse
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Optional
-from sys import stderr
+from sys import stderr, stdout
 import re
 
 # === CONSTANTS ===
@@ -33,6 +34,12 @@ SBAND_BPS = SBAND_BPS_BASE / COMM_OVERHEAD
 UHF_BPS_BASE = 9600
 UHF_BPS = UHF_BPS_BASE / COMM_OVERHEAD
 
+# PRECOMPUTED PER-ROW/PER-EVENT VALUES
+_SUMMARY_BPS = SUMMARY_FRAME_SIZE / SUMMARY_COLLECTION_PERIOD_S
+_RDA_STORED_DATA = RDA_ACQUIRED_DATA / LOSSY_COMPRESSION_RATE
+# bits -> MiB, as reported by print_state
+_MIB_DIV = 8 * 10**6
+
 
 # OPERATIONAL MODE NAMES
 E_START_SIMULATION = "start_simulation"
@@ -49,18 +56,67 @@ E_UHF_COM_END = "uhf_com_end"
 E_UHF_COM_START = "uhf_com_start"
 
 
-# RELEVANT COLUMNS
-COL_DURATION = "Operation duration"
-COL_SHADOW = "Shadow"
-COL_MODE = "Operational Mode"
-COL_TIME = "Time"
-COL_EVENT = "Event"
-
-# GLOBAL
-ROW_IDX = 1
-
-
-@dataclass
+# events are resolved to small ints once, while parsing, so that the fold
+# only has to index into the handler table
+class Event(IntEnum):
+    START_SIMULATION = 0
+    PREP_START_RDA = 1
+    PREP_START_S_BAND = 2
+    PREP_START_UHF = 3
+    RDA_END = 4
+    RDA_START = 5
+    S_BAND_COM_END = 6
+    S_BAND_COM_START = 7
+    SHADOW_ENTER = 8
+    SHADOW_EXIT = 9
+    UHF_COM_END = 10
+    UHF_COM_START = 11
+
+
+EVENT_IDS = {
+    E_START_SIMULATION: Event.START_SIMULATION,
+    E_PREP_START_RDA: Event.PREP_START_RDA,
+    E_PREP_START_S_BAND: Event.PREP_START_S_BAND,
+    E_PREP_START_UHF: Event.PREP_START_UHF,
+    E_RDA_END: Event.RDA_END,
+    E_RDA_START: Event.RDA_START,
+    E_S_BAND_COM_END: Event.S_BAND_COM_END,
+    E_S_BAND_COM_START: Event.S_BAND_COM_START,
+    E_SHADOW_ENTER: Event.SHADOW_ENTER,
+    E_SHADOW_EXIT: Event.SHADOW_EXIT,
+    E_UHF_COM_END: Event.UHF_COM_END,
+    E_UHF_COM_START: Event.UHF_COM_START,
+}
+EVENT_NAMES = {event_id: name for name, event_id in EVENT_IDS.items()}
+
+
+# "orbit x" or "  - x" event suffixes, once normalized
+_SUFFIX_RE = re.compile(r"_(?:orbit|-)_\d+$")
+
+_MONTH_NAMES = (
+    "january",
+    "february",
+    "march",
+    "april",
+    "may",
+    "june",
+    "july",
+    "august",
+    "september",
+    "october",
+    "november",
+    "december",
+)
+_MONTHS_FULL = {name: idx for idx, name in enumerate(_MONTH_NAMES, start=1)}
+_MONTHS_ABBR = {name[:3]: idx for idx, name in enumerate(_MONTH_NAMES, start=1)}
+
+# _event_key(raw event) -> event id, the set of distinct events is tiny
+_EVENT_CACHE: dict[tuple[str, bool], Event] = {}
+# raw duration string -> seconds, durations repeat a lot between orbits
+_DURATION_CACHE: dict[str, int] = {}
+
+
+@dataclass(slots=True)
 class MissionState:
     s_band_start: Optional[datetime] = None
     uhf_band_start: Optional[datetime] = None
@@ -78,68 +134,13 @@ class MissionState:
     wasted_s_band: float = 0.0
 
 
-def mb(size):
-    return round(size / (10**6), 1)
-
-
-# def process_step(state: MissionState, step: pd.Series):
-#     current_time = colored(f"{step[COL_TIME]}", "light_magenta")
-#
-#     if OP_SBAND in step[COL_MODE]:
-#         maximum_transferable = SBAND_BPS * step[COL_DURATION].total_seconds()
-#         needed = state.stored_image_data - state.sent_image_data
-#
-#         state.sent_image_data += min(needed, maximum_transferable)
-#
-#         transfer_status = ""
-#         if needed == 0:
-#             transfer_status = colored("NO", "red")
-#         elif maximum_transferable > needed:
-#             transfer_status = colored("COMPLETE", "green")
-#         else:
-#             transfer_status = colored("PARTIAL", "green")
-#
-#         unused = mb(max(maximum_transferable - needed, 0))
-#         if unused == 0:
-#             unused = colored(f"{unused}", "green")
-#         elif needed > 0:
-#             unused = colored(f"{unused}", "yellow")
-#         else:
-#             unused = colored(f"{unused}", "red")
-#
-#         transferable_colored = colored(f"{mb(maximum_transferable)}", "green")
-#         needed_colored = ""
-#
-#         if needed == 0:
-#             needed_colored = colored(f"{mb(needed)}", "dark_grey")
-#         else:
-#             needed_colored = colored(f"{mb(needed)}", "yellow")
-#
-#         op_mode = colored("SBAND", "cyan")
-#         print(
-#             f"{current_time}: {op_mode} {transfer_status} TRANSFER, {transferable_colored} Mb maximum transferable, {needed_colored} Mb needed, {unused} Mb wasted"
-#         )
-#
-#     if (
-#         OP_RDA in step[COL_EVENT]
-#         and E_START in step[COL_EVENT]
-#         and E_PREP not in step[COL_EVENT]
-#     ):
-#         previously_unsent = state.stored_image_data - state.sent_image_data
-#
-#         acquired_data = RDA_ACQUIRED_DATA / LOSSLESS_COMPRESSION_RATE
-#         state.total_images += PHOTOS_DURING_RDA
-#         state.stored_image_data += acquired_data
-#
-#         op_mode = colored("RDA", "cyan")
-#         print(
-#             f"{current_time}: {op_mode}   {mb(acquired_data)} Mb generated currently, {mb(state.stored_image_data)} Mb generated overall, {state.total_images} photos overall, {mb(previously_unsent)} Mb unsent from previous RDA"
-#         )
-#
-
-
-def normalize(col: str):
-    return re.sub(r"\s+", " ", col).strip().lower().replace(" ", "_")
+def _to_mib(num: float) -> float:
+    return num / _MIB_DIV
+
+
+def normalize(col: str) -> str:
+    # same as collapsing every \s+ run into "_", without the regex
+    return "_".join(col.split()).lower()
 
 
 def check_header(col, expected):
@@ -149,198 +150,240 @@ def check_header(col, expected):
         )
 
 
-def check_is_opened(value, event):
-    global ROW_IDX
-
+def check_is_opened(value: Optional[datetime], event: str, row_idx: int) -> datetime:
     if value is None:
         raise ValueError(
-            f"Unexpected event, encountered '{event}' twice, without a corresponding start, at row {ROW_IDX}"
+            f"Unexpected event, encountered '{event}' twice, without a corresponding start, at row {row_idx}"
         )
 
+    return value
 
-def check_is_closed(value, event):
-    global ROW_IDX
 
+def check_is_closed(value: Optional[datetime], event: str, row_idx: int) -> None:
     if value is not None:
         raise ValueError(
-            f"Unexpected event, encountered '{event}' twice, without a corresponding end, at row {ROW_IDX}"
+            f"Unexpected event, encountered '{event}' twice, without a corresponding end, at row {row_idx}"
         )
 
 
-def normalize_time(time: str):
-    global ROW_IDX
+def _time_field(value: str, min_width: int, max_width: int) -> int:
+    # int() alone is far more lenient than strptime (signs, "_", any width),
+    # only take what the %d/%m/%Y/%H/%M/%S directives would have matched
+    if not (
+        min_width <= len(value) <= max_width and value.isascii() and value.isdigit()
+    ):
+        raise ValueError(f"Malformed time field '{value}'")
+
+    return int(value)
+
+
+def normalize_time(time: str, row_idx: int) -> datetime:
+    # parse by hand, strptime is by far the slowest part of a row
+    try:
+        if "/" in time:
+            # %d/%m/%Y %H:%M
+            date, clock = time.split()
+            day, month_num, year = date.split("/")
+            hour, minute = clock.split(":")
+            return datetime(
+                _time_field(year, 4, 4),
+                _time_field(month_num, 1, 2),
+                _time_field(day, 1, 2),
+                _time_field(hour, 1, 2),
+                _time_field(minute, 1, 2),
+            )
 
-    if "/" in time:
-        return datetime.strptime(time, "%d/%m/%Y %H:%M")
+        # %d-%b-%Y %H:%M:%S or %d-%B-%Y %H:%M:%S
+        date, clock = time.split()
+        day, month_name, year = date.split("-")
+        hour, minute, second = clock.split(":")
+        month_name = month_name.lower()
+        if len(month_name) == 3:
+            month = _MONTHS_ABBR[month_name]
+        else:
+            month = _MONTHS_FULL[month_name]
+
+        return datetime(
+            _time_field(year, 4, 4),
+            month,
+            _time_field(day, 1, 2),
+            _time_field(hour, 1, 2),
+            _time_field(minute, 1, 2),
+            _time_field(second, 1, 2),
+        )
+    except (ValueError, KeyError):
+        raise ValueError(f"Unrecognized time '{time}', at row {row_idx}")
+
+
+def _event_key(event_raw: str) -> tuple[str, bool]:
+    # cache key for normalize_event: the normalized event with its _SUFFIX_RE
+    # suffix cut off, and whether it had one. the orbit number is the only
+    # thing that changes between occurrences of an event, so dropping it is
+    # what makes the cache hit. _resolve_event only ever sees this key, so two
+    # raw events sharing a key always resolve (or fail) the same way
+    stem, found = _SUFFIX_RE.subn("", normalize(event_raw))
+    return stem, found > 0
+
+
+def _resolve_event(key: tuple[str, bool], row_idx: int) -> Event:
+    stem, has_suffix = key
+    if has_suffix:
+        event = stem.replace("-", "_")
+    elif stem == E_START_SIMULATION:
+        event = stem
     else:
-        try:
-            return datetime.strptime(time, "%d-%b-%Y %H:%M:%S")
-        except:
-            pass
+        # the "orbit x" or "  - x" suffix is mandatory for everything else
+        raise ValueError(f"Unrecognized event: '{stem}', at row {row_idx}")
 
-        try:
-            return datetime.strptime(time, "%d-%B-%Y %H:%M:%S")
-        except:
-            raise ValueError(f"Unrecognized time '{time}', at row {ROW_IDX}")
+    event_id = EVENT_IDS.get(event)
+    if event_id is None:
+        raise ValueError(f"Unrecognized event: '{event}', at row {row_idx}")
 
+    return event_id
 
-def normalize_event(event: str):
-    event = normalize(event)
-    if event == E_START_SIMULATION:
-        return event
 
-    # get rid of "orbit x" or "  - x" suffixes
-    return "_".join(event.split("_")[:-2]).replace("-", "_")
+def normalize_event(event_raw: str, row_idx: int) -> Event:
+    key = _event_key(event_raw)
+    cached = _EVENT_CACHE.get(key)
+    if cached is not None:
+        return cached
 
+    event_id = _resolve_event(key, row_idx)
+    _EVENT_CACHE[key] = event_id
+    return event_id
 
-def normalize_duration(duration: str):
-    split_duration = [int(x) for x in duration.split(":")]
-    return timedelta(
-        hours=split_duration[0], minutes=split_duration[1], seconds=split_duration[2]
-    )
 
+def normalize_duration(duration: str, row_idx: int) -> int:
+    # returns whole seconds, the fold only ever needs the duration as a number
+    cached = _DURATION_CACHE.get(duration)
+    if cached is not None:
+        return cached
 
-def process_row(state: MissionState, row):
-    (
-        time,
-        orbit,
-        duration,
-        shadow,
-        event,
-        op_mode,
-        op_desc,
-        adcs_mode,
-        comments,
-        useful_info,
-        _,
-    ) = row
-
-    time = normalize_time(time)
-    duration = normalize_duration(duration)
-    event = normalize_event(event)
+    try:
+        # fast path for the fixed width HH:MM:SS shape
+        if len(duration) == 8 and duration[2] == ":" and duration[5] == ":":
+            h = int(duration[0:2])
+            m = int(duration[3:5])
+            s = int(duration[6:8])
+            parsed = h * 3600 + m * 60 + s
+        else:
+            hours, minutes, seconds = [int(x) for x in duration.split(":")]
+            parsed = hours * 3600 + minutes * 60 + seconds
+    except ValueError:
+        raise ValueError(f"Unrecognized duration '{duration}', at row {row_idx}")
 
-    # TODO: fix this, this would assume that we are sending full frames, ebcause the constants are not updated
-    state.stored_summaries += SUMMARY_FRAME_SIZE * (
-        duration.total_seconds() / SUMMARY_COLLECTION_PERIOD_S
-    )
+    _DURATION_CACHE[duration] = parsed
+    return parsed
 
-    if event == E_START_SIMULATION:
-        return
 
-    # actually process the event
-    if (
-        event == E_PREP_START_RDA
-        or event == E_PREP_START_S_BAND
-        or event == E_PREP_START_UHF
-    ):
-        # we do not really do anything in the prep stages,
-        # so just ignore all of them
-        pass
-    elif event == E_SHADOW_ENTER or event == E_SHADOW_EXIT:
-        # shadow is only relevant for power generation, we do not
-        # simulate that at the moment, so ignore it as well
-        pass
-    elif event == E_RDA_START:
-        check_is_closed(state.rda_start, event)
-        state.rda_start = time
-
-    elif event == E_RDA_END:
-        check_is_opened(state.rda_start, event)
-        state.rda_start = None
-
-        state.total_images += PHOTOS_DURING_RDA
-        state.stored_image_data += RDA_ACQUIRED_DATA / LOSSY_COMPRESSION_RATE
-
-    elif event == E_S_BAND_COM_START:
-        check_is_closed(state.s_band_start, event)
-        state.s_band_start = time
-
-    elif event == E_S_BAND_COM_END:
-        check_is_opened(state.s_band_start, event)
-        delta: timedelta = time - state.s_band_start
-        state.s_band_start = None
-
-        potential_transfer = SBAND_BPS * delta.total_seconds()
-        print(SBAND_BPS)
-        print(delta.total_seconds())
-        print(potential_transfer)
-        needed = state.stored_image_data - state.sent_image_data
-
-        state.wasted_s_band += max(potential_transfer - needed, 0)
-        state.sent_image_data += min(needed, potential_transfer)
-
-    elif event == E_UHF_COM_START:
-        check_is_closed(state.uhf_band_start, event)
-        state.uhf_band_start = time
-
-    elif event == E_UHF_COM_END:
-        check_is_opened(state.uhf_band_start, event)
-        delta: timedelta = time - state.uhf_band_start
-        state.uhf_band_start = None
-
-        # TODO: telecommands + actual frame data
-        potential_transfer = UHF_BPS * delta.total_seconds()
-        needed = state.stored_summaries - state.sent_summaries
-
-        state.wasted_uhf_band += max(potential_transfer - needed, 0)
-        state.sent_summaries += min(needed, potential_transfer)
+def _ignore_event(state: MissionState, time: datetime, row_idx: int) -> None:
+    pass
 
-    else:
-        raise ValueError(f"Unrecognized event: '{event}'")
 
-    # Telemetry is always processed so, add it at the end of the processing
-    global ROW_IDX
-    ROW_IDX += 1
+def _on_rda_start(state: MissionState, time: datetime, row_idx: int) -> None:
+    check_is_closed(state.rda_start, E_RDA_START, row_idx)
+    state.rda_start = time
+
+
+def _on_rda_end(state: MissionState, time: datetime, row_idx: int) -> None:
+    check_is_opened(state.rda_start, E_RDA_END, row_idx)
+    state.rda_start = None
+
+    state.total_images += PHOTOS_DURING_RDA
+    state.stored_image_data += _RDA_STORED_DATA
 
 
-def print_state(state: MissionState):
-    global ROW_IDX
+def _on_s_band_start(state: MissionState, time: datetime, row_idx: int) -> None:
+    check_is_closed(state.s_band_start, E_S_BAND_COM_START, row_idx)
+    state.s_band_start = time
 
-    (
-        time,
-        orbit,
-        duration,
-        shadow,
-        event,
-        op_mode,
-        op_desc,
-        adcs_mode,
-        comments,
-        useful_ino,
-        _,
-    ) = row
 
-    time = normalize_time(time)
-    duration = normalize_duration(duration)
-    event = normalize_event(event)
+def _on_s_band_end(state: MissionState, time: datetime, row_idx: int) -> None:
+    start = check_is_opened(state.s_band_start, E_S_BAND_COM_END, row_idx)
+    delta = time - start
+    state.s_band_start = None
 
-    def process_number_to_MiB(num: float):
-        return num / 8 / 10**6
+    potential_transfer = SBAND_BPS * delta.total_seconds()
+    needed = state.stored_image_data - state.sent_image_data
+    transfer = potential_transfer if potential_transfer < needed else needed
 
+    state.wasted_s_band += potential_transfer - transfer
+    state.sent_image_data += transfer
+
+
+def _on_uhf_start(state: MissionState, time: datetime, row_idx: int) -> None:
+    check_is_closed(state.uhf_band_start, E_UHF_COM_START, row_idx)
+    state.uhf_band_start = time
+
+
+def _on_uhf_end(state: MissionState, time: datetime, row_idx: int) -> None:
+    start = check_is_opened(state.uhf_band_start, E_UHF_COM_END, row_idx)
+    delta = time - start
+    state.uhf_band_start = None
+
+    # TODO: telecommands + actual frame data
+    potential_transfer = UHF_BPS * delta.total_seconds()
+    needed = state.stored_summaries - state.sent_summaries
+    transfer = potential_transfer if potential_transfer < needed else needed
+
+    state.wasted_uhf_band += potential_transfer - transfer
+    state.sent_summaries += transfer
+
+
+_HANDLERS_BY_EVENT = {
+    Event.START_SIMULATION: _ignore_event,
+    # we do not really do anything in the prep stages,
+    # so just ignore all of them
+    Event.PREP_START_RDA: _ignore_event,
+    Event.PREP_START_S_BAND: _ignore_event,
+    Event.PREP_START_UHF: _ignore_event,
+    # shadow is only relevant for power generation, we do not
+    # simulate that at the moment, so ignore it as well
+    Event.SHADOW_ENTER: _ignore_event,
+    Event.SHADOW_EXIT: _ignore_event,
+    Event.RDA_START: _on_rda_start,
+    Event.RDA_END: _on_rda_end,
+    Event.S_BAND_COM_START: _on_s_band_start,
+    Event.S_BAND_COM_END: _on_s_band_end,
+    Event.UHF_COM_START: _on_uhf_start,
+    Event.UHF_COM_END: _on_uhf_end,
+}
+
+# indexed directly by the event id, Event(i) fails at import if the ids are
+# not exactly 0..N-1
+_HANDLERS = tuple(_HANDLERS_BY_EVENT[Event(i)] for i in range(len(Event)))
+
+
+def process_row(
+    state: MissionState,
+    time: datetime,
+    duration_s: int,
+    event: Event,
+    row_idx: int,
+) -> None:
+    # TODO: fix this, this would assume that we are sending full frames, ebcause the constants are not updated
+    state.stored_summaries += _SUMMARY_BPS * duration_s
+
+    _HANDLERS[event](state, time, row_idx)
+
+
+def print_state(state: MissionState, time: datetime, event: Event) -> None:
     # This looks like shit
-    print(f"============== {time} : {event:20} =================")
-    print(
-        f"Stored summaries : {process_number_to_MiB(state.stored_summaries):20.6f} MiB"
-    )
-    print(f"Sent   summaries : {process_number_to_MiB(state.sent_summaries):20.6f} MiB")
-    print(
-        f"To be transfered : {process_number_to_MiB(state.stored_summaries - state.sent_summaries):20.1f} MiB"
-    )
-    print(
-        f"Wasted UHF       : {process_number_to_MiB(state.wasted_uhf_band):20.6f} MiB"
-    )
-    print()
-    print(
-        f"Stored image data: {process_number_to_MiB(state.stored_image_data):20.6f} MiB"
-    )
-    print(
-        f"Sent   image data: {process_number_to_MiB(state.sent_image_data):20.6f} MiB"
-    )
-    print(
-        f"To be transfered : {process_number_to_MiB(state.stored_image_data - state.sent_image_data):20.6f} MiB"
-    )
-    print(f"Wasted S-Band    : {process_number_to_MiB(state.wasted_s_band):20.6f} MiB")
-    print()
+    # build the whole block and write it once, instead of a dozen print calls
+    lines = [
+        f"============== {time} : {EVENT_NAMES[event]:20} =================",
+        f"Stored summaries : {_to_mib(state.stored_summaries):20.6f} MiB",
+        f"Sent   summaries : {_to_mib(state.sent_summaries):20.6f} MiB",
+        f"To be transfered : {_to_mib(state.stored_summaries - state.sent_summaries):20.1f} MiB",
+        f"Wasted UHF       : {_to_mib(state.wasted_uhf_band):20.6f} MiB",
+        "",
+        f"Stored image data: {_to_mib(state.stored_image_data):20.6f} MiB",
+        f"Sent   image data: {_to_mib(state.sent_image_data):20.6f} MiB",
+        f"To be transfered : {_to_mib(state.stored_image_data - state.sent_image_data):20.6f} MiB",
+        f"Wasted S-Band    : {_to_mib(state.wasted_s_band):20.6f} MiB",
+        "",
+    ]
+    stdout.write("\n".join(lines) + "\n")
     # print(state.sent_summaries)
     # print(state.wasted_uhf_band)
 
@@ -348,9 +391,15 @@ def print_state(state: MissionState):
 if __name__ == "__main__":
     argparser = argparse.ArgumentParser()
     argparser.add_argument("-f", "--input-file", required=True)
+    argparser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="print the mission state after every row, not just the final one",
+    )
     args = argparser.parse_args()
 
-    with open(args.input_file, "r") as f:
+    with open(args.input_file, "r", buffering=1 << 20, newline="") as f:
         reader = csv.reader(f)
 
         try:
@@ -388,7 +437,28 @@ if __name__ == "__main__":
         check_header(comments_h, "comments")
         check_header(useful_info_h, "useful_information")
 
+        # printing the state is far more expensive than processing a row,
+        # so only do it per row when explicitly asked for
+        report_state = print_state if args.verbose else lambda state, time, event: None
+
+        # parse every row up front, the loop below then only has to fold the
+        # (inherently sequential) state updates over already parsed data.
+        # only the time, duration and event columns matter for the simulation
+        times: list[datetime] = []
+        durations_s: list[int] = []
+        events: list[Event] = []
+        # the header is row 1
+        for row_idx, row in enumerate(reader, start=2):
+            times.append(normalize_time(row[0], row_idx))
+            durations_s.append(normalize_duration(row[2], row_idx))
+            events.append(normalize_event(row[4], row_idx))
+
         state = MissionState()
-        for row in reader:
-            process_row(state, row)
-            print_state(state)
+        for row_idx, (time, duration_s, event) in enumerate(
+            zip(times, durations_s, events), start=2
+        ):
+            process_row(state, time, duration_s, event, row_idx)
+            report_state(state, time, event)
+
+        if not args.verbose and events:
+            print_state(state, times[-1], events[-1])